@@ -9,88 +9,257 @@ Features:
 - Flashcards generation
 - Download plan as PDF / JSON
 Instructions:
-- Install: pip install streamlit openai reportlab
+- Install: pip install streamlit aiohttp numpy orjson reportlab
 - Run: streamlit run agentic_planner_app.py
 """
 
 import streamlit as st
+import asyncio
+import atexit
+import hashlib
 import os
 import json
+import numpy as np
+import orjson
 import random
+import re
+import tempfile
+import threading
+import time
 from datetime import datetime
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
 from io import BytesIO
+from xml.sax.saxutils import escape
 
 # ------------------ Helper Functions ------------------ #
 
-def get_openai_api_key():
+# The script is re-executed on every rerun, so a plain lru_cache would start empty each time.
+# Exceptions aren't cached, so a missing key is looked up again until one is configured.
+@st.cache_resource(show_spinner=False)
+def _read_openai_api_key():
     key = None
     try:
         key = st.secrets["OPENAI_API_KEY"]
     except:
         key = os.environ.get("OPENAI_API_KEY")
+    if not key:
+        raise LookupError("OPENAI_API_KEY is not set")
     return key
 
-def call_openai_for_plan(goal, weeks, mentor_style):
-    api_key = get_openai_api_key()
-    prompt = f"""
+def get_openai_api_key():
+    try:
+        return _read_openai_api_key()
+    except LookupError:
+        return None
+
+PLAN_MODEL = "gpt-4o-mini"
+SYSTEM_PROMPT = "You are a helpful planning assistant that returns valid JSON."
+OPENAI_CHAT_URL = "https://api.openai.com/v1/chat/completions"
+
+def _close_aio_session(loop, session):
+    asyncio.run_coroutine_threadsafe(session.close(), loop).result(timeout=5)
+    loop.call_soon_threadsafe(loop.stop)
+
+@st.cache_resource(show_spinner=False)
+def get_aio_session():
+    # Returns (loop, session), shared by every browser session in this process. The loop
+    # runs in a background thread so the aiohttp connection pool outlives reruns.
+    import aiohttp
+
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+
+    async def _open():
+        return aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=100, ttl_dns_cache=300),
+            timeout=aiohttp.ClientTimeout(total=120)
+        )
+
+    session = asyncio.run_coroutine_threadsafe(_open(), loop).result()
+    atexit.register(_close_aio_session, loop, session)
+    return loop, session
+
+PLAN_CACHE_DIR = ".plan_cache"
+PLAN_CACHE_TTL = 7*24*60*60
+
+def plan_cache_key(goal, weeks, mentor_style):
+    raw = orjson.dumps({
+        "g": " ".join(goal.lower().split()),
+        "w": int(weeks),
+        "m": mentor_style,
+        "model": PLAN_MODEL
+    }, option=orjson.OPT_SORT_KEYS)
+    return hashlib.sha256(raw).hexdigest()
+
+def plan_cache_get(key):
+    path = os.path.join(PLAN_CACHE_DIR, f"{key}.json")
+    try:
+        if time.time() - os.path.getmtime(path) > PLAN_CACHE_TTL:
+            os.remove(path)
+            return None
+        with open(path, "rb") as f:
+            return orjson.loads(f.read())
+    except (OSError, ValueError):
+        return None
+
+def plan_cache_set(key, plan_json):
+    try:
+        os.makedirs(PLAN_CACHE_DIR, exist_ok=True)
+        with tempfile.NamedTemporaryFile("wb", dir=PLAN_CACHE_DIR, suffix=".tmp", delete=False) as f:
+            f.write(orjson.dumps(plan_json))
+        os.replace(f.name, os.path.join(PLAN_CACHE_DIR, f"{key}.json"))
+    except OSError:
+        pass  # caching is best-effort
+
+_json_decoder = json.JSONDecoder()
+
+def _extract_json(text):
+    # Parse the first JSON object in one pass; leading/trailing prose is ignored.
+    start = text.find('{')
+    if start == -1:
+        raise ValueError("No JSON object in model output")
+    return _json_decoder.raw_decode(text, start)[0]
+
+def _chat_payload(prompt, max_tokens):
+    return {
+        "model": PLAN_MODEL,
+        "messages": [
+            {"role":"system", "content": SYSTEM_PROMPT},
+            {"role":"user", "content": prompt}
+        ],
+        "temperature": 0.6,
+        "max_tokens": max_tokens
+    }
+
+async def _chat_json(session, api_key, prompt, max_tokens):
+    payload = _chat_payload(prompt, max_tokens)
+    payload["stream"] = True
+    # JSON mode: the stream ends right after the object, so draining it below is cheap.
+    payload["response_format"] = {"type": "json_object"}
+    headers = {"Authorization": f"Bearer {api_key}"}
+    buf = ""
+    start = -1
+    obj = None
+    async with session.post(OPENAI_CHAT_URL, headers=headers, json=payload) as resp:
+        resp.raise_for_status()
+        # Read through [DONE] even once the object is parsed; leaving the body unread
+        # makes aiohttp close the connection instead of returning it to the pool.
+        async for line in resp.content:
+            line = line.strip()
+            if not line.startswith(b"data:"):
+                continue
+            data = line[5:].strip()
+            if data == b"[DONE]":
+                break
+            if obj is not None:
+                continue
+            delta = orjson.loads(data)["choices"][0]["delta"].get("content") or ""
+            buf += delta
+            if start == -1:
+                start = buf.find("{")
+            if start != -1 and "}" in delta:
+                try:
+                    obj = _json_decoder.raw_decode(buf, start)[0]
+                except ValueError:
+                    pass  # object not complete yet
+    return obj if obj is not None else _extract_json(buf)
+
+async def stream_plan_sections(goal, weeks, mentor_style, api_key, session):
+    # Yields ("outline", {...}) and ("Week N", {...}) pairs in completion order.
+    weeks = int(max(1, weeks))
+    outline_prompt = f"""
 You are an expert study planner and mentor with the persona: {mentor_style}.
 User goal: "{goal}". Timeframe: {weeks} weeks.
 Output a JSON with keys:
 - milestones: [..]
-- weeks: {{ "Week 1": {{ "Tasks":[..], "Resources":[..], "Reflection": "...", "Mentor_Tip": "..." }}, ... }}
 - mentor_notes: "..."
+Return only valid JSON.
+"""
+
+    async def gen_outline():
+        return "outline", await _chat_json(session, api_key, outline_prompt, max_tokens=300)
+
+    async def gen_week(w):
+        prompt = f"""
+You are an expert study planner and mentor with the persona: {mentor_style}.
+User goal: "{goal}". Timeframe: {weeks} weeks. Plan week {w} of {weeks} only.
+Output a JSON with keys:
+{{ "Tasks":[..], "Resources":[..], "Reflection": "...", "Mentor_Tip": "..." }}
 Return only valid JSON. Keep resources short (title or url if relevant).
 """
+        return f"Week {w}", await _chat_json(session, api_key, prompt, max_tokens=300)
+
+    # One request per week, all in flight at once: total latency is roughly one round-trip.
+    pending = [asyncio.ensure_future(gen_outline())]
+    pending += [asyncio.ensure_future(gen_week(w)) for w in range(1, weeks+1)]
+    try:
+        for fut in asyncio.as_completed(pending):
+            yield await fut
+    finally:
+        for task in pending:
+            task.cancel()
+
+def assemble_plan(sections, weeks):
+    outline = sections.get("outline", {})
+    return {
+        "milestones": outline.get("milestones", []),
+        "weeks": {f"Week {w}": sections[f"Week {w}"] for w in range(1, int(max(1, weeks))+1)},
+        "mentor_notes": outline.get("mentor_notes", "")
+    }
+
+def call_openai_for_plan(goal, weeks, mentor_style, on_section=None):
+    # Returns (plan, from_ai); from_ai is False when the fallback template was used.
+    # on_section(name, value) is called on the script thread as each section arrives.
+    api_key = get_openai_api_key()
     if not api_key:
-        return fallback_plan(goal, weeks, mentor_style)
+        return fallback_plan(goal, weeks, mentor_style), False
+
+    key = plan_cache_key(goal, weeks, mentor_style)
+    cached = plan_cache_get(key)
+    if cached is not None:
+        return cached, True
 
     try:
-        import openai
-        openai.api_key = api_key
-        response = openai.ChatCompletion.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role":"system", "content": "You are a helpful planning assistant that returns valid JSON."},
-                {"role":"user", "content": prompt}
-            ],
-            temperature=0.6,
-            max_tokens=900
-        )
-        text = response["choices"][0]["message"]["content"].strip()
-        start = text.find('{')
-        end = text.rfind('}')
-        if start != -1 and end != -1:
-            text = text[start:end+1]
-        plan_json = json.loads(text)
-        return plan_json
+        loop, session = get_aio_session()
+        sections = stream_plan_sections(goal, weeks, mentor_style, api_key, session)
+        received = {}
+        while True:
+            try:
+                name, value = asyncio.run_coroutine_threadsafe(sections.__anext__(), loop).result()
+            except StopAsyncIteration:
+                break
+            received[name] = value
+            if on_section:
+                on_section(name, value)
+        plan_json = assemble_plan(received, weeks)
+        plan_cache_set(key, plan_json)
+        return plan_json, True
     except Exception as e:
         st.warning(f"OpenAI call failed or returned invalid JSON. Using fallback plan. ({str(e)})")
-        return fallback_plan(goal, weeks, mentor_style)
+        return fallback_plan(goal, weeks, mentor_style), False
+
+_TIPS = (
+    "Consistency beats intensity. Try daily small steps.",
+    "Break tasks into 25-minute Pomodoro sprints.",
+    "Google errors, read docs, then refactor."
+)
+_TASK_FMT = (
+    "{m} Task: Spend focused 60-90 minutes on a core topic (week {w})",
+    "Practice: 30 minutes of hands-on exercises (week {w})",
+)
 
 def fallback_plan(goal, weeks, mentor_style):
     weeks = int(max(1, weeks))
-    milestones = []
     milestones_templates = ["Foundation", "Core Skills", "Practice & Projects", "Final Project"]
-    for i in range(min(4, weeks)):
-        milestones.append(f"{milestones_templates[i]} - Week {i+1}")
+    milestones = [f"{m} - Week {i+1}" for i, m in enumerate(milestones_templates[:min(4, weeks)])]
     if weeks > 4:
         milestones.append("Polish & Review")
 
     weeks_dict = {}
-    for w in range(1, weeks+1):
-        tasks = [
-            f"{mentor_style} Task: Spend focused 60-90 minutes on a core topic (week {w})",
-            f"Practice: 30 minutes of hands-on exercises (week {w})",
-        ]
+    tips = random.choices(_TIPS, k=weeks)
+    for w, tip in enumerate(tips, start=1):
+        tasks = [f.format(m=mentor_style, w=w) for f in _TASK_FMT]
         resources = ["Official docs / Quick YouTube tutorial", "A short project or code-along"]
         reflection = "What was the biggest challenge this week and one action to fix it?"
-        tip = random.choice([
-            "Consistency beats intensity. Try daily small steps.",
-            "Break tasks into 25-minute Pomodoro sprints.",
-            "Google errors, read docs, then refactor."
-        ])
         weeks_dict[f"Week {w}"] = {
             "Tasks": tasks,
             "Resources": resources,
@@ -102,6 +271,16 @@ def fallback_plan(goal, weeks, mentor_style):
 
     return {"milestones": milestones, "weeks": weeks_dict, "mentor_notes": mentor_notes}
 
+_WEEK_REF = re.compile(r"\b([Ww])eek (\d+)\b")
+
+def _rescale_week_refs(text, original_weeks, remaining_weeks):
+    # The last task of old week N lands in week ceil(N*rem/orig) after array_split.
+    def week(m):
+        n = min(int(m.group(2)), original_weeks)
+        return f"{m.group(1)}eek {max(1, -(-n*remaining_weeks // original_weeks))}"
+    text = _WEEK_REF.sub(week, text)
+    return re.sub(rf"\b{original_weeks} weeks\b", f"{remaining_weeks} weeks", text)
+
 def recompress_plan(plan_json, original_weeks, remaining_weeks):
     weeks_keys = list(plan_json.get("weeks", {}).keys())
     all_tasks = []
@@ -111,19 +290,22 @@ def recompress_plan(plan_json, original_weeks, remaining_weeks):
         all_tasks.extend(entry.get("Tasks", []))
         all_resources.extend(entry.get("Resources", []))
     rem = max(1, int(remaining_weeks))
+    # array_split spreads any remainder over the first weeks, so no task is dropped.
+    task_chunks = np.array_split(np.array(all_tasks, dtype=object), rem)
+    res_chunks = np.array_split(np.array(all_resources, dtype=object), rem)
     new_weeks = {}
-    t_per_week = max(1, len(all_tasks)//rem)
     for i in range(rem):
-        slice_tasks = all_tasks[i*t_per_week:(i+1)*t_per_week]
-        if not slice_tasks:
-            slice_tasks = ["Catch-up session: review core concepts"]
         new_weeks[f"Week {i+1}"] = {
-            "Tasks": slice_tasks,
-            "Resources": all_resources[i*t_per_week:(i+1)*t_per_week] if all_resources else ["Docs"],
+            "Tasks": task_chunks[i].tolist() or ["Catch-up session: review core concepts"],
+            "Resources": res_chunks[i].tolist() or ["Docs"],
             "Reflection": "What will you prioritize next week?",
             "Mentor_Tip": "Focus on the highest-impact tasks first."
         }
     plan_json["weeks"] = new_weeks
+    # Milestones and notes refer to the old timeframe; point them at the new weeks.
+    orig = max(1, int(original_weeks))
+    plan_json["milestones"] = [_rescale_week_refs(m, orig, rem) for m in plan_json.get("milestones", [])]
+    plan_json["mentor_notes"] = _rescale_week_refs(plan_json.get("mentor_notes", ""), orig, rem)
     return plan_json
 
 def generate_flashcards(plan_json, current_week=1):
@@ -137,72 +319,194 @@ def generate_flashcards(plan_json, current_week=1):
         cards.append({"q": q, "a": a})
     return cards
 
-def create_pdf_bytes(plan_json, title="Agentic Plan"):
+def flashcard_schema(week_names):
+    # Built per request so "week" must be one of this plan's week labels.
+    return {
+        "name": "flashcards",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "weeks": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "week": {"type": "string", "enum": list(week_names)},
+                            "cards": {
+                                "type": "array",
+                                "items": {
+                                    "type": "object",
+                                    "properties": {"q": {"type": "string"}, "a": {"type": "string"}},
+                                    "required": ["q", "a"],
+                                    "additionalProperties": False
+                                }
+                            }
+                        },
+                        "required": ["week", "cards"],
+                        "additionalProperties": False
+                    }
+                }
+            },
+            "required": ["weeks"],
+            "additionalProperties": False
+        }
+    }
+
+FLASHCARD_MAX_TOKENS = 16000  # gpt-4o-mini caps output at 16384
+FLASHCARD_CARD_TOKENS = 100   # one q/a pair plus its JSON
+FLASHCARD_WEEK_TOKENS = 40    # {"week": ..., "cards": [...]} wrapper
+
+async def call_openai_for_flashcards_async(plan_json, api_key, session):
+    weeks = plan_json.get("weeks", {})
+    n_weeks = max(1, len(weeks))
+    # Up to 5 cards a week, fewer on long plans so the whole reply fits the output cap.
+    per_week = FLASHCARD_MAX_TOKENS // n_weeks - FLASHCARD_WEEK_TOKENS
+    cards_per_week = max(1, min(5, per_week // FLASHCARD_CARD_TOKENS))
+    max_tokens = min(FLASHCARD_MAX_TOKENS, 200 + n_weeks*(FLASHCARD_WEEK_TOKENS + FLASHCARD_CARD_TOKENS*cards_per_week))
+    lines = []
+    for wk, content in weeks.items():
+        lines.append(f"{wk}:")
+        lines.extend(f"- {t}" for t in content.get("Tasks", []))
+    tasks_text = "\n".join(lines)
+    prompt = f"""
+Write up to {cards_per_week} study flashcards for each week of this plan. Each card has a short question "q" and answer "a".
+Return JSON: {{"weeks": [{{"week": "Week 1", "cards": [{{"q": "...", "a": "..."}}]}}, ...]}} with one entry per week.
+
+{tasks_text}
+"""
+    payload = _chat_payload(prompt, max_tokens=max_tokens)
+    payload["response_format"] = {"type": "json_schema", "json_schema": flashcard_schema(weeks)}
+    headers = {"Authorization": f"Bearer {api_key}"}
+    async with session.post(OPENAI_CHAT_URL, headers=headers, json=payload) as resp:
+        resp.raise_for_status()
+        data = await resp.json(loads=orjson.loads)
+    choice = data["choices"][0]
+    if choice.get("finish_reason") == "length":
+        raise ValueError(f"flashcard reply was cut off at {max_tokens} tokens")
+    result = orjson.loads(choice["message"]["content"])
+    return {entry["week"]: entry["cards"] for entry in result["weeks"]}
+
+def generate_all_flashcards(plan_json):
+    # Cards for every week from a single request; local cards without a key or on failure.
+    cards = {}
+    api_key = get_openai_api_key()
+    if api_key:
+        try:
+            loop, session = get_aio_session()
+            coro = call_openai_for_flashcards_async(plan_json, api_key, session)
+            cards = asyncio.run_coroutine_threadsafe(coro, loop).result()
+        except Exception as e:
+            st.warning(f"OpenAI flashcard call failed. Using local flashcards. ({str(e)})")
+    # Any week the model skipped or left empty gets local cards, so no week comes up blank.
+    for i, wk in enumerate(plan_json.get("weeks", {}), start=1):
+        if not cards.get(wk):
+            cards[wk] = generate_flashcards(plan_json, i)
+    return cards
+
+@st.cache_resource(show_spinner=False)
+def _pdf_styles():
+    # The sample stylesheet and the three paragraph styles, built once per process.
+    from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+    styles = getSampleStyleSheet()
+    title_style = ParagraphStyle("PlanTitle", parent=styles["Title"], fontName="Helvetica-Bold", fontSize=16, alignment=0)
+    heading = ParagraphStyle("PlanHeading", parent=styles["Heading3"], fontName="Helvetica-Bold", fontSize=12)
+    body = ParagraphStyle("PlanBody", parent=styles["BodyText"], fontName="Helvetica", fontSize=11, leading=14)
+    return title_style, heading, body
+
+def create_pdf_bytes(plan_json, title="Agentic Plan", generated=None):
+    from reportlab.lib.pagesizes import letter
+    from reportlab.platypus import ListFlowable, ListItem, Paragraph, SimpleDocTemplate, Spacer
     buffer = BytesIO()
-    c = canvas.Canvas(buffer, pagesize=letter)
-    width, height = letter
-    margin = 40
-    y = height - margin
-    c.setFont("Helvetica-Bold", 16)
-    c.drawString(margin, y, title)
-    y -= 30
-    c.setFont("Helvetica", 11)
-    c.drawString(margin, y, f"Generated: {datetime.utcnow().strftime('%Y-%m-%d %H:%M UTC')}")
-    y -= 25
-    # Milestones
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(margin, y, "Milestones:")
-    y -= 18
-    c.setFont("Helvetica", 11)
-    for m in plan_json.get("milestones", []):
-        c.drawString(margin+10, y, f"- {m}")
-        y -= 14
-        if y < 60:
-            c.showPage()
-            y = height - margin
-    y -= 8
+    title_style, heading, body = _pdf_styles()
+
+    def para(text, style=body):
+        return Paragraph(escape(str(text)), style)
+
+    def bullets(items):
+        return ListFlowable([ListItem(para(i)) for i in items], bulletType="bullet", leftIndent=14)
+
+    story = [
+        para(title, title_style),
+        para(f"Generated: {generated or datetime.utcnow().strftime('%Y-%m-%d %H:%M UTC')}"),
+        Spacer(1, 10),
+        para("Milestones:", heading),
+    ]
+    milestones = plan_json.get("milestones", [])
+    if milestones:
+        story.append(bullets(milestones))
     # Weeks
     for wk, content in plan_json.get("weeks", {}).items():
-        c.setFont("Helvetica-Bold", 12)
-        c.drawString(margin, y, wk)
-        y -= 16
-        c.setFont("Helvetica", 11)
-        for t in content.get("Tasks", []):
-            c.drawString(margin+8, y, f"• {t}")
-            y -= 12
-            if y < 60:
-                c.showPage()
-                y = height - margin
+        story.append(para(wk, heading))
+        tasks = content.get("Tasks", [])
+        if tasks:
+            story.append(bullets(tasks))
         res = content.get("Resources", [])
         if res:
-            c.drawString(margin+8, y, "Resources: " + ", ".join(res[:3]))
-            y -= 14
+            story.append(para("Resources: " + ", ".join(res[:3])))
         refl = content.get("Reflection", "")
         tip = content.get("Mentor_Tip", "")
         if refl:
-            c.drawString(margin+8, y, "Reflection: " + refl)
-            y -= 12
+            story.append(para("Reflection: " + refl))
         if tip:
-            c.drawString(margin+8, y, "Tip: " + tip)
-            y -= 18
-        if y < 80:
-            c.showPage()
-            y = height - margin
+            story.append(para("Tip: " + tip))
     # Mentor notes
-    c.setFont("Helvetica-Bold", 12)
-    c.drawString(margin, y, "Mentor Notes:")
-    y -= 16
-    c.setFont("Helvetica", 11)
+    story.append(para("Mentor Notes:", heading))
     for line in plan_json.get("mentor_notes", "").split("\n"):
-        c.drawString(margin+8, y, line)
-        y -= 12
-        if y < 60:
-            c.showPage()
-            y = height - margin
-    c.save()
+        story.append(para(line))
+
+    doc = SimpleDocTemplate(buffer, pagesize=letter, leftMargin=40, rightMargin=40, topMargin=40, bottomMargin=40, title=title)
+    doc.build(story)
     buffer.seek(0)
     return buffer
 
+@st.cache_data(show_spinner=False, ttl=24*60*60)
+def _build_pdf(plan_bytes, title, generated):
+    # plan_bytes is the plan serialized with its key order intact, so weeks stay in order.
+    # generated is the plan's own timestamp, so a cached PDF never shows a stale build time.
+    return create_pdf_bytes(orjson.loads(plan_bytes), title=title, generated=generated).getvalue()
+
+@st.cache_data(show_spinner=False, ttl=24*60*60)
+def _build_json(plan_bytes):
+    return orjson.dumps(orjson.loads(plan_bytes), option=orjson.OPT_INDENT_2)
+
+def reset_progress(plan_json, carry=None):
+    # carry: checks from a plan with the same tasks in the same order (a resize); kept ticked.
+    # Drop widget state left over from the previous plan so the counts start clean.
+    for tid in range(st.session_state.checks.size):
+        st.session_state.pop(tid, None)
+    # Give every task a stable integer id; it is both its widget key and its index in checks.
+    task_ids = {}
+    offset = 0
+    for wk, content in plan_json.get("weeks", {}).items():
+        n = len(content.get("Tasks", []))
+        task_ids[wk] = range(offset, offset+n)
+        offset += n
+    checks = np.zeros(offset, dtype=np.uint8)
+    if carry is not None:
+        n = min(carry.size, offset)
+        checks[:n] = carry[:n]
+        for tid in np.flatnonzero(checks):
+            st.session_state[int(tid)] = True
+    st.session_state.task_ids = task_ids
+    st.session_state.checks = checks
+    st.session_state.percent = int(np.count_nonzero(checks)/offset*100) if offset else 0
+
+def toggle_task(tid):
+    st.session_state.checks[tid] = st.session_state[tid]
+
+def load_plan(plan_json, plan_key, carry=None):
+    st.session_state.plan = plan_json
+    st.session_state.plan_key = plan_key
+    st.session_state.plan_generated = datetime.utcnow().strftime('%Y-%m-%d %H:%M UTC')
+    st.session_state.current_week = 1
+    reset_progress(plan_json, carry)  # reset tasks
+    st.session_state.pdf_requested = False
+    st.session_state.flashcards = None
+
+def request_pdf():
+    st.session_state.pdf_requested = True
+
 # ------------------ Streamlit UI ------------------ #
 
 st.set_page_config(page_title="Agentic AI Planner", layout="centered")
@@ -218,43 +522,75 @@ with st.form("input_form"):
 
 # Session state initialization
 if "plan" not in st.session_state: st.session_state.plan = None
+if "plan_key" not in st.session_state: st.session_state.plan_key = None
+if "plan_generated" not in st.session_state: st.session_state.plan_generated = None
 if "xp" not in st.session_state: st.session_state.xp = 0
 if "percent" not in st.session_state: st.session_state.percent = 0
 if "current_week" not in st.session_state: st.session_state.current_week = 1
-if "tasks_checked" not in st.session_state: st.session_state.tasks_checked = {}
+if "task_ids" not in st.session_state: st.session_state.task_ids = {}
+if "checks" not in st.session_state: st.session_state.checks = np.zeros(0, dtype=np.uint8)
+if "pdf_requested" not in st.session_state: st.session_state.pdf_requested = False
+if "flashcards" not in st.session_state: st.session_state.flashcards = None
 
 # Generate plan
 if submitted:
+    plan_key = (goal.strip(), int(weeks), mentor_style)
+    old_key = st.session_state.plan_key
     if not goal.strip():
         st.error("Please enter a goal to generate a plan.")
+    elif st.session_state.plan and plan_key == old_key:
+        st.info("This plan is already loaded.")
+    elif st.session_state.plan and old_key and (plan_key[0], plan_key[2]) == (old_key[0], old_key[2]):
+        # Only the timeframe changed: prefer the AI plan already generated for this timeframe,
+        # otherwise redistribute the existing tasks instead of regenerating.
+        cached = plan_cache_get(plan_cache_key(goal, weeks, mentor_style))
+        if cached is not None:
+            load_plan(cached, plan_key)
+            st.success(f"Loaded the saved {plan_key[1]}-week plan.")
+        else:
+            # array_split keeps task order, so ticked tasks keep their ids; catch-up placeholders start unticked.
+            checks = st.session_state.checks
+            load_plan(recompress_plan(st.session_state.plan, old_key[1], plan_key[1]), plan_key, carry=checks)
+            st.success(f"Plan resized to {plan_key[1]} weeks.")
     else:
+        live = st.empty()
+        with live.container():
+            milestones_slot = st.empty()
+            week_slots = {f"Week {w}": st.empty() for w in range(1, int(weeks)+1)}
+
+        def show_section(name, value):
+            if name == "outline":
+                milestones_slot.markdown("**Milestones:** " + " → ".join(value.get("milestones", [])))
+            elif name in week_slots:
+                week_slots[name].markdown(f"**{name}:** " + "; ".join(value.get("Tasks", [])))
+
         with st.spinner("Generating plan with AI..."):
-            plan = call_openai_for_plan(goal, weeks, mentor_style)
-            st.session_state.plan = plan
-            st.session_state.percent = 0
-            st.session_state.current_week = 1
-            st.session_state.tasks_checked = {}  # reset tasks
+            plan, from_ai = call_openai_for_plan(goal, weeks, mentor_style, on_section=show_section)
+        live.empty()
+        # Fallback plans get no key, so resubmitting retries the API instead of reusing them.
+        load_plan(plan, plan_key if from_ai else None)
         st.success("Plan generated! Scroll down to view.")
 
-# Show Milestones
-if st.session_state.plan:
-    plan = st.session_state.plan
-    st.subheader("Milestones")
-    for m in plan.get("milestones", []):
-        st.write("• " + m)
+# Indexed by percent (0-100); folded into a single constant at compile time.
+_TREE = ("🌱",)*10 + ("🌱🌿",)*30 + ("🌱🌿🌳",)*30 + ("🌱🌿🌳🌲",)*31
 
-    st.subheader("Weekly Plan with Checkboxes")
-    total_tasks = 0
-    completed_tasks = 0
+def emoji_tree(p):
+    return _TREE[min(p, 100)]
+
+def render_progress(slot):
+    with slot.container():
+        st.progress(st.session_state.percent)
+        st.markdown("**Progress Tree:** " + emoji_tree(st.session_state.percent))
+        st.metric("XP", st.session_state.percent*10)
+
+# Ticking a checkbox reruns only this fragment; it then refreshes the progress panel in place.
+@st.fragment
+def render_tasks(plan, progress_slot):
     for wk, content in plan.get("weeks", {}).items():
         with st.expander(wk):
             st.markdown("**Tasks:**")
-            for t in content.get("Tasks", []):
-                key = f"{wk}_{t}"
-                checked = st.checkbox(t, key=key, value=st.session_state.tasks_checked.get(key, False))
-                st.session_state.tasks_checked[key] = checked
-                total_tasks += 1
-                if checked: completed_tasks += 1
+            for tid, t in zip(st.session_state.task_ids[wk], content.get("Tasks", [])):
+                st.checkbox(t, key=tid, on_change=toggle_task, args=(tid,))
 
             st.markdown("**Resources:**")
             for r in content.get("Resources", []):
@@ -265,8 +601,20 @@ if st.session_state.plan:
             st.write(content.get("Mentor_Tip", ""))
 
     # Update progress based on tasks checked
-    if total_tasks > 0:
-        st.session_state.percent = int(completed_tasks/total_tasks*100)
+    checks = st.session_state.checks
+    if checks.size > 0:
+        st.session_state.percent = int(np.count_nonzero(checks)/checks.size*100)
+    render_progress(progress_slot)
+
+# Show Milestones
+if st.session_state.plan:
+    plan = st.session_state.plan
+    st.subheader("Milestones")
+    for m in plan.get("milestones", []):
+        st.write("• " + m)
+
+    st.subheader("Weekly Plan with Checkboxes")
+    tasks_area = st.container()
 
 # Show Mentor Notes
 if st.session_state.plan:
@@ -275,21 +623,23 @@ if st.session_state.plan:
 
 # Progress panel
 st.subheader("Progress")
-st.progress(st.session_state.percent)
-
-def emoji_tree(p):
-    if p < 10: return "🌱"
-    if p < 40: return "🌱🌿"
-    if p < 70: return "🌱🌿🌳"
-    return "🌱🌿🌳🌲"
-
-st.markdown("**Progress Tree:** " + emoji_tree(st.session_state.percent))
-st.metric("XP", st.session_state.percent*10)
+progress_slot = st.empty()
+if st.session_state.plan:
+    with tasks_area:
+        render_tasks(st.session_state.plan, progress_slot)
+else:
+    render_progress(progress_slot)
 
 # Flashcards
 if st.session_state.plan:
-    if st.button("Generate Flashcards for Current Week"):
-        cards = generate_flashcards(st.session_state.plan, st.session_state.current_week)
+    week_count = max(1, len(st.session_state.plan.get("weeks", {})))
+    st.selectbox("Flashcards week", range(1, week_count+1), key="current_week", format_func=lambda w: f"Week {w}")
+    # One request fills every week; afterwards switching weeks just reads st.session_state.flashcards.
+    if st.session_state.flashcards is None and st.button("Generate Flashcards"):
+        with st.spinner("Generating flashcards..."):
+            st.session_state.flashcards = generate_all_flashcards(st.session_state.plan)
+    if st.session_state.flashcards is not None:
+        cards = st.session_state.flashcards.get(f"Week {st.session_state.current_week}", [])
         st.subheader(f"Flashcards - Week {st.session_state.current_week}")
         for i, c in enumerate(cards, start=1):
             st.markdown(f"**Q{i}.** {c['q']}")
@@ -297,9 +647,14 @@ if st.session_state.plan:
 
 # Download Plan
 if st.session_state.plan:
-    pdf_bytes = create_pdf_bytes(st.session_state.plan, title=f"Plan: {goal[:60]}")
-    st.download_button(label="Download Plan as PDF", data=pdf_bytes, file_name="agentic_plan.pdf", mime="application/pdf")
-    st.download_button(label="Download Plan (JSON)", data=json.dumps(st.session_state.plan, indent=2), file_name="agentic_plan.json", mime="application/json")
+    plan_bytes = orjson.dumps(st.session_state.plan)
+    # ReportLab is only imported and run once the user asks for a PDF.
+    if st.session_state.pdf_requested:
+        pdf_bytes = _build_pdf(plan_bytes, title=f"Plan: {goal[:60]}", generated=st.session_state.plan_generated)
+        st.download_button(label="Download Plan as PDF", data=pdf_bytes, file_name="agentic_plan.pdf", mime="application/pdf")
+    else:
+        st.button("Prepare PDF", on_click=request_pdf)
+    st.download_button(label="Download Plan (JSON)", data=_build_json(plan_bytes), file_name="agentic_plan.json", mime="application/json")
 
 st.markdown("---")
 st.caption("Built with Streamlit + OpenAI. Progress bar now dynamically updates as you check off tasks.")
\ No newline at end of file